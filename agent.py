@@ -1,11 +1,13 @@
 import os
 import json
 import logging
+import atexit
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 from gymnasium import spaces, Env
-from typing import Dict
-import ta  # För tekniska indikatorer
+from typing import Dict, Optional
 
 # Uppdaterade importer baserat på indikatorfiler
 from indicators.momentum_indicators import MomentumIndicators
@@ -17,8 +19,77 @@ from market import Market
 from mock_portfolio import MockPortfolio
 from config import Config
 
+log = logging.getLogger(__name__)
+
+# Minsta totala antal rader innan indikatorerna beräknas i flera processer (under det dominerar uppstartskostnaden)
+PARALLEL_INDICATOR_MIN_ROWS = 50_000
+
+
+def _add_indicators_for_asset(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Batch-bearbeta alla indikatormoduler för en tillgång.
+    Ligger på modulnivå så att den kan skickas till en ProcessPoolExecutor.
+    """
+    data = pd.DataFrame(data)
+    data = MomentumIndicators.add_all_indicators(data)
+    data = TrendIndicators.add_all_indicators(data)
+    data = VolatilityIndicators.add_all_indicators(data)
+    data = VolumeIndicators.add_all_indicators(data)
+    return data
+
+
+# SharedMemory-block som skapats av denna process och ska frigöras vid avslut
+_SHARED_BLOCKS = []
+
+
+def share_env_matrices(historical_data: Dict[str, pd.DataFrame]) -> dict:
+    """
+    Beräkna indikatorer och miljöns matriser en gång och lägg dem i delat minne.
+    Metadata som returneras skickas till MultiAssetTradingEnv(shared_meta=...) i varje arbetare,
+    som då bara kopplar upp vyer mot blocken i stället för att räkna om allt.
+    :param historical_data: Rå historisk data per tillgång.
+    :return: Dict med tillgångsordning och (namn, shape, dtype) per matris.
+    """
+    assets = list(historical_data.keys())
+    matrices = MultiAssetTradingEnv._build_matrices(MultiAssetTradingEnv._add_indicators(historical_data), assets)
+
+    arrays = {}
+    for key, matrix in matrices.items():
+        shm = SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=shm.buf)[...] = matrix
+        _SHARED_BLOCKS.append(shm)
+        arrays[key] = (shm.name, matrix.shape, matrix.dtype.str)
+
+    return {"assets": assets, "arrays": arrays}
+
+
+@atexit.register
+def _release_shared_blocks():
+    """Stäng och ta bort delade minnesblock som skapats av share_env_matrices."""
+    while _SHARED_BLOCKS:
+        shm = _SHARED_BLOCKS.pop()
+        shm.close()
+        shm.unlink()
+
+
+def _attach_shared_matrices(shared_meta: dict):
+    """
+    Koppla upp skrivskyddade ndarray-vyer mot matriser i delat minne.
+    :return: (matriser per nyckel, SharedMemory-handtag som måste hållas vid liv)
+    """
+    matrices, handles = {}, []
+    for key, (name, shape, dtype) in shared_meta["arrays"].items():
+        shm = SharedMemory(name=name)
+        matrix = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        matrix.flags.writeable = False
+        matrices[key] = matrix
+        handles.append(shm)
+    return matrices, handles
+
+
 class MultiAssetTradingEnv(Env):
-    def __init__(self, market: Market, portfolio: MockPortfolio, historical_data: Dict[str, pd.DataFrame]):
+    def __init__(self, market: Market, portfolio: MockPortfolio,
+                 historical_data: Optional[Dict[str, pd.DataFrame]] = None, shared_meta: Optional[dict] = None):
         super(MultiAssetTradingEnv, self).__init__()
 
         # Ladda konfigurationer
@@ -28,51 +99,134 @@ class MultiAssetTradingEnv(Env):
 
         self.market = market
         self.portfolio = portfolio
-        self.historical_data = self._add_indicators(historical_data)
-        self.assets = list(historical_data.keys())
+        self._shared_blocks = []
+
+        if shared_meta is not None:
+            # Matriserna är redan beräknade (share_env_matrices), koppla upp mot delat minne
+            self.historical_data = historical_data
+            self.assets = list(shared_meta["assets"])
+            matrices, self._shared_blocks = _attach_shared_matrices(shared_meta)
+        else:
+            self.historical_data = self._add_indicators(historical_data)
+            self.assets = list(historical_data.keys())
+            matrices = self._build_matrices(self.historical_data, self.assets)
+
         self.num_assets = len(self.assets)
+        self._obs_matrix = matrices["obs"]
+        self._close_matrix = matrices["close"]
+        self._adx_matrix = matrices["adx"]
+
+        # Varje observationsrad ska vara en sammanhängande float32-vektor
+        if not self._obs_matrix.flags['C_CONTIGUOUS'] or self._obs_matrix.strides[1] != 4:
+            raise ValueError("Observationsmatrisen måste vara C-ordnad float32.")
         self.fee = env_config["fee"]
         self.current_step = 0
-        self.portfolio.previous_value = self.portfolio.get_total_value(
-            {asset: self.historical_data[asset].iloc[0]['close'] for asset in self.assets}
-        )
+
+        # Portföljens innehavsvektor måste följa samma tillgångsordning som prismatrisen
+        if list(self.portfolio.assets) != self.assets:
+            raise ValueError("Portföljens tillgångar matchar inte miljöns tillgångar.")
+        self.portfolio.previous_value = self.portfolio.get_total_value(self._close_matrix[0])
 
         # Dynamiskt sätt observation_space baserat på data
         self.observation_space = spaces.Box(
             low=-1.0,
             high=1.0,
-            shape=(self.num_assets * (self.historical_data[self.assets[0]].shape[1] - 1),),
+            shape=(self._obs_matrix.shape[1],),
             dtype=np.float32
         )
 
         # Action space: One action per asset (buy, hold, sell)
         self.action_space = spaces.Box(low=-1, high=1, shape=(self.num_assets,), dtype=np.float32)
 
+        # Återanvänd buffert för observationer (se _get_observation)
+        self._obs_buf = np.empty(self.observation_space.shape, dtype=np.float32)
+
         # Sammanfattad loggning
-        logging.info(f"Miljön initialiserad med {self.num_assets} tillgångar och observation_space {self.observation_space.shape}")
+        log.info(f"Miljön initialiserad med {self.num_assets} tillgångar och observation_space {self.observation_space.shape}")
         
-    def _add_indicators(self, historical_data: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    @staticmethod
+    def _add_indicators(historical_data: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
         """
         Lägg till tekniska indikatorer till historiska data. Robust felhantering tillagd.
         Flyttad batch-bearbetning av indikatorer till respektive moduler.
+        Tillgångarna beräknas parallellt i separata processer när datamängden är stor nog.
         """
+        total_rows = sum(len(data) for data in historical_data.values())
+        workers = min(len(historical_data), os.cpu_count() or 1)
+
+        if workers > 1 and total_rows >= PARALLEL_INDICATOR_MIN_ROWS:
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = {
+                        asset: pool.submit(_add_indicators_for_asset, data)
+                        for asset, data in historical_data.items()
+                    }
+                    for asset, future in futures.items():
+                        try:
+                            historical_data[asset] = future.result()
+                        except Exception as e:
+                            log.warning(f"Kunde inte lägga till indikatorer för {asset}: {e}")
+                return historical_data
+            except (OSError, AssertionError) as e:
+                # T.ex. i SubprocVecEnv-arbetare (daemon-processer) som inte får starta egna processer
+                log.warning(f"Parallell indikatorberäkning ej möjlig ({e}). Kör sekventiellt.")
+
         for asset, data in historical_data.items():
             try:
-                data = pd.DataFrame(data)
+                historical_data[asset] = _add_indicators_for_asset(data)
+            except Exception as e:
+                log.warning(f"Kunde inte lägga till indikatorer för {asset}: {e}")
 
-                # Batch-bearbeta indikatorer per tillgång
-                data = MomentumIndicators.add_all_indicators(data)
-                data = TrendIndicators.add_all_indicators(data)
-                data = VolatilityIndicators.add_all_indicators(data)
-                data = VolumeIndicators.add_all_indicators(data)
+        return historical_data
 
-                historical_data[asset] = data
+    @staticmethod
+    def _build_matrices(historical_data: Dict[str, pd.DataFrame], assets) -> Dict[str, np.ndarray]:
+        """
+        Packa historiska data till sammanhängande NumPy-matriser (en kolumn per tillgång och fält).
+        Steg-loopen läser sedan en rad per steg i stället för att gå via pandas-indexering.
+        :return: Dict med obs (normaliserad till [-1, 1]), close och adx.
+        """
+        frames = [historical_data[asset] for asset in assets]
 
-            except Exception as e:
-                logging.warning(f"Kunde inte lägga till indikatorer för {asset}: {e}")
+        # Observationer: alla kolumner utom tidsstämpeln, tillgångarna efter varandra.
+        # C-ordnad float32 så att normaliseringen per rad går på NumPys SIMD-loopar.
+        obs_matrix = np.ascontiguousarray(np.concatenate(
+            [df.iloc[:, 1:].to_numpy(dtype=np.float32, copy=True) for df in frames], axis=1
+        ), dtype=np.float32)
+
+        # Globala normaliseringskonstanter per kolumn: obs * inv_range - shift ger [-1, 1].
+        # Bara ändliga värden räknas, så NaN/inf (t.ex. indikatorernas uppvärmningsperiod) påverkar inte skalan.
+        finite = np.isfinite(obs_matrix)
+        min_data = np.where(finite, obs_matrix, np.inf).min(axis=0).astype(np.float64)
+        max_data = np.where(finite, obs_matrix, -np.inf).max(axis=0).astype(np.float64)
+        no_finite = ~finite.any(axis=0)  # Kolumner helt utan ändliga värden behandlas som konstanta
+        min_data[no_finite] = 0.0
+        max_data[no_finite] = 0.0
+        span = np.subtract(max_data, min_data, out=max_data)
+        flat = span == 0  # Konstanta kolumner normaliseras till 0 (inv_range = shift = 0)
+        inv_range = np.divide(2.0, span, out=np.zeros_like(span), where=~flat)
+        shift = np.multiply(min_data, inv_range, out=min_data)
+        shift += 1.0
+        shift[flat] = 0.0
+
+        # Normalisera hela matrisen en gång här i stället för varje steg, och rensa NaN/inf efter
+        # normaliseringen (NaN -> 0, +inf -> 1, -inf -> -1)
+        with np.errstate(invalid="ignore"):
+            np.multiply(obs_matrix, inv_range.astype(np.float32), out=obs_matrix)
+            np.subtract(obs_matrix, shift.astype(np.float32), out=obs_matrix)
+        np.nan_to_num(obs_matrix, copy=False, nan=0.0, posinf=1.0, neginf=-1.0)
+        np.clip(obs_matrix, -1.0, 1.0, out=obs_matrix)  # Avrundning i float32 kan hamna precis utanför
+
+        return {
+            "obs": obs_matrix,
+            # Priser och trendstyrka per tillgång, shape (T, num_assets)
+            "close": np.stack([df['close'].to_numpy(dtype=np.float64) for df in frames], axis=1),
+            "adx": np.stack([
+                df['ADX'].to_numpy(dtype=np.float64) if 'ADX' in df else np.zeros(len(df))
+                for df in frames
+            ], axis=1),
+        }
 
-        return historical_data
-    
     def reset(self, seed=None, options=None):
         """Återställ miljön till startläget."""
         if seed is not None:
@@ -80,90 +234,75 @@ class MultiAssetTradingEnv(Env):
 
         self.current_step = 0
         self.portfolio.reset()  # Återställ portföljen
-        obs = self._get_observation()
+        obs = self._get_observation().copy()  # Egen kopia, bufferten skrivs över av nästa step()
 
-        logging.info("Miljön återställd till initialt tillstånd.")
+        if log.isEnabledFor(logging.INFO):
+            log.info("Miljön återställd till initialt tillstånd.")
         return obs, {}
 
     def step(self, action):
         """Utför en action och gå till nästa steg."""
         self.current_step += 1
-        action_summary = []  # För summerad loggning
+        step = self.current_step
+        portfolio = self.portfolio
 
-        for i, asset in enumerate(self.assets):
-            try:
-                price = self.historical_data[asset].iloc[self.current_step]['close']
-                trend_strength = self.historical_data[asset].iloc[self.current_step].get('ADX', 0)
-
-                # Justera growth limit baserat på trend
-                self.portfolio.adjust_growth_limit(trend_strength)
-
-                if action[i] > 0:  # Köp
-                    quantity = action[i] * self.portfolio.balance / price
-                    self.portfolio.buy(asset, price, quantity)
-                    action_summary.append(f"Köp: {asset} Mängd: {quantity:.4f} Pris: {price:.2f}")
-                elif action[i] < 0:  # Sälj
-                    quantity = -action[i] * self.portfolio.holdings.get(asset, 0)
-                    self.portfolio.sell(asset, price, quantity)
-                    action_summary.append(f"Sälj: {asset} Mängd: {quantity:.4f} Pris: {price:.2f}")
-
-            except ValueError as e:
-                logging.warning(f"Åtgärd misslyckades för {asset}: {e}")
-            except KeyError:
-                logging.warning(f"Data saknas för {asset} vid steg {self.current_step}.")
+        prices = self._close_matrix[step]
+        trends = self._adx_matrix[step]
+
+        # Justera growth limit en gång per steg utifrån den starkaste trenden
+        portfolio.adjust_growth_limit(trends.max())
+
+        # Alla köp/sälj för steget genomförs vektoriserat i ett anrop
+        try:
+            portfolio.apply_actions(action, prices)
+        except ValueError as e:
+            log.warning("Åtgärder misslyckades vid steg %d: %s", step, e)
 
         reward = self._calculate_reward(action)
-        done = self.current_step >= len(self.historical_data[self.assets[0]]) - 1
+        done = step >= self._close_matrix.shape[0] - 1
         truncated = False  # gymnasium kräver detta för kompatibilitet
         obs = self._get_observation()
+        if done:
+            # VecEnv sparar sista observationen som info["terminal_observation"] och anropar sedan
+            # reset(), som skriver i samma buffert; returnera därför en kopia
+            obs = obs.copy()
 
-        # Sammanfattad loggning
-        logging.info(f"Steg {self.current_step}: Reward={reward:.4f}. Sammanfattning: {', '.join(action_summary)}")
+        # Sammanfattad loggning (formateras bara om INFO är aktiverat)
+        if log.isEnabledFor(logging.INFO):
+            log.info("Steg %d: Reward=%.4f", step, reward)
 
         return obs, reward, done, truncated, {}
     
     def _get_observation(self):
-        """Hämta nuvarande observation och normalisera."""
+        """
+        Hämta nuvarande observation (redan normaliserad i _build_matrices).
+        Returnerar samma förallokerade buffert varje steg; den skrivs över vid nästa anrop.
+        step() och reset() returnerar en kopia när observationen måste överleva nästa anrop
+        (terminal observation respektive startobservation); i övrigt måste den som vill spara en
+        observation mellan steg själv göra obs.copy().
+        """
+        obs = self._obs_buf
         try:
-            # Hämta observationerna för alla tillgångar och normalisera dem
-            obs = np.concatenate([
-                self._normalize(self.historical_data[asset].iloc[self.current_step, 1:].to_numpy())
-                for asset in self.assets
-            ]).astype(np.float32)
-
-            # Säkerställ att inga NaN eller inf-värden finns i observationen
-            obs = np.nan_to_num(obs, nan=0.0, posinf=1.0, neginf=-1.0)
+            # Hämta de normaliserade observationerna för alla tillgångar
+            np.copyto(obs, self._obs_matrix[self.current_step])
 
         except Exception as e:
-            logging.error(f"Fel vid skapande av observation: {e}")
-            obs = np.zeros(self.observation_space.shape, dtype=np.float32)
+            log.error(f"Fel vid skapande av observation: {e}")
+            obs.fill(0.0)
 
         return obs
 
-    def _normalize(self, data):
-        """Normalisera data mellan -1 och 1."""
-        min_data = np.min(data)
-        max_data = np.max(data)
-
-        # Förhindra att vi delar med noll om min_data == max_data
-        if max_data == min_data:
-            return np.zeros_like(data)
-
-        # Normalisera mellan -1 och 1
-        return 2 * (data - min_data) / (max_data - min_data) - 1
-
     def _calculate_reward(self, action):
         """Beräkna belöning baserat på action."""
         try:
-            current_prices = {asset: self.historical_data[asset].iloc[self.current_step]['close'] for asset in self.assets}
-            current_value = self.portfolio.get_total_value(current_prices)
+            current_value = self.portfolio.get_total_value(self._close_matrix[self.current_step])
             reward = (current_value - self.portfolio.previous_value) / max(self.portfolio.previous_value, 1e-8)
 
             # Justera riskgränser dynamiskt
             self.portfolio.adjust_risk_limit(reward)
             self.portfolio.previous_value = current_value
         except Exception as e:
-            logging.error(f"Fel vid beräkning av belöning: {e}")
+            log.error(f"Fel vid beräkning av belöning: {e}")
             reward = -1  # Straffa vid fel
 
         return reward
@@ -1,15 +1,32 @@
+import copy
 import logging
 import os
 import json
 from dotenv import load_dotenv
 
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson är valfritt, standardbibliotekets json används annars
+    def _loads(raw):
+        return json.loads(raw.decode("utf-8"))
+
+# Tolkade konfigurationsfiler per (sökväg, ändringstid), delas mellan Config-instanser
+_CONFIG_CACHE = {}
+
+# .env-filer som redan laddats i denna process
+_LOADED_ENV_FILES = set()
+
 class Config:
     def __init__(self, env_file="Nycklar.env"):
         """
         Initiera Config-klassen som laddar miljövariabler och konfigurationsinställningar dynamiskt.
         :param env_file: Sökvägen till .env-filen med API-nycklar.
         """
-        load_dotenv(env_file)  # Ladda miljövariabler från .env-filen
+        # Ladda miljövariabler från .env-filen, bara första gången i processen
+        if env_file not in _LOADED_ENV_FILES:
+            load_dotenv(env_file)
+            _LOADED_ENV_FILES.add(env_file)
 
         # Ladda rätt config-fil baserat på miljövariabel
         config_mode = os.getenv("CONFIG_MODE", "live")  # Standard: live
@@ -23,8 +40,13 @@ class Config:
         """
         if os.path.exists(self.config_file):
             try:
-                with open(self.config_file, 'r') as f:
-                    return json.load(f)
+                path = os.path.abspath(self.config_file)
+                key = (path, os.stat(path).st_mtime_ns)
+                if key not in _CONFIG_CACHE:
+                    with open(path, 'rb') as f:
+                        _CONFIG_CACHE[key] = _loads(f.read())
+                # Egen kopia per instans så att ändringar i en Config inte läcker till andra
+                return copy.deepcopy(_CONFIG_CACHE[key])
             except Exception as e:
                 logging.error(f"Error loading config file {self.config_file}: {e}")
         else:
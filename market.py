@@ -1,14 +1,15 @@
 import numpy as np
 import pandas as pd
-import random
 import logging
 
 class Market:
-    def __init__(self):
+    def __init__(self, rng=None):
         """
         Simulerad marknad som tillhandahåller data för flera tillgångar.
+        :param rng: Seed eller np.random.Generator för reproducerbar mockdata (None ger slumpmässig seed).
         """
         self.active_symbols = ["BTC/USDT", "ETH/USDT", "LTC/USDT"]  # Exempel på symboler
+        self.rng = np.random.default_rng(rng)
 
     def fetch_market_data(self, min_volume=10):
         """
@@ -16,10 +17,11 @@ class Market:
         :param min_volume: Minsta volym för att inkludera en symbol.
         :return: DataFrame med marknadsdata.
         """
+        num_symbols = len(self.active_symbols)
         data = {
             "symbol": self.active_symbols,
-            "volume": [random.uniform(min_volume, min_volume * 10) for _ in self.active_symbols],
-            "price": [random.uniform(10, 100) for _ in self.active_symbols],
+            "volume": self.rng.uniform(min_volume, min_volume * 10, size=num_symbols),
+            "price": self.rng.uniform(10, 100, size=num_symbols),
         }
         df = pd.DataFrame(data)
         df = df[df["volume"] >= min_volume].reset_index(drop=True)  # Filtrera baserat på volym
@@ -41,26 +43,28 @@ class Market:
             timeframe = 'T'
 
         timestamp = pd.date_range(start="2023-01-01", periods=limit, freq=timeframe)
-        close = np.cumsum(np.random.randn(limit)) + 50  # Simulerat pris
-        high = close + np.random.uniform(0.5, 1.5, limit)
-        low = close - np.random.uniform(0.5, 1.5, limit)
-        volume = np.random.uniform(100, 1000, limit)
+        close = self.rng.standard_normal(limit).cumsum() + 50  # Simulerat pris
+        high_offset, low_offset = self.rng.uniform(0.5, 1.5, size=(2, limit))
+        high = close + high_offset
+        low = close - low_offset
+        volume = self.rng.uniform(100, 1000, limit)
 
-        df = pd.DataFrame({
+        # Lägg till fler fält för att simulera verklig data
+        open_ = np.empty_like(close)
+        open_[0] = close[0]
+        open_[1:] = close[:-1]
+
+        return pd.DataFrame({
             "timestamp": timestamp,
             "close": close,
             "high": high,
             "low": low,
-            "volume": volume
+            "volume": volume,
+            "open": open_,
+            "volatility": (high - low) / close,
+            "trend_strength": self.rng.uniform(0, 1, limit),  # Slumpad trendstyrka
         })
 
-        # Lägg till fler fält för att simulera verklig data
-        df["open"] = df["close"].shift(1).fillna(df["close"][0])
-        df["volatility"] = (df["high"] - df["low"]) / df["close"]
-        df["trend_strength"] = np.random.uniform(0, 1, limit)  # Slumpad trendstyrka
-
-        return df
-
     def simulate_market_conditions(self, condition="bullish"):
         """
         Simulera marknadsförhållanden och anpassa priser därefter.
@@ -74,9 +78,6 @@ class Market:
         }
 
         factor = factor_map.get(condition, 1.00)
-        for symbol in self.active_symbols:
-            new_data = self.fetch_historical_data(symbol=symbol, limit=100)
-            new_data["close"] *= factor  # Anpassa slutpris baserat på förhållande
-            logging.info(f"Simulerade {condition} marknadsförhållanden för {symbol}.")
+        logging.info(f"Simulerade {condition} marknadsförhållanden (faktor {factor}) för {', '.join(self.active_symbols)}.")
 
         return self.active_symbols
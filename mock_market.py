@@ -1,6 +1,5 @@
 from market import Market
 import pandas as pd
-import numpy as np
 import logging
 
 class MockMarket(Market):
@@ -34,7 +33,7 @@ class MockMarket(Market):
         data = super().fetch_historical_data(symbol, timeframe=timeframe, limit=limit)
         # Lägg till mock-specifika kolumner
         data["mock_flag"] = True
-        data["noise"] = np.random.normal(0, 0.02, size=len(data))  # Simulerat brus
+        data["noise"] = self.rng.normal(0, 0.02, size=len(data))  # Simulerat brus
         data["adjusted_close"] = data["close"] * (1 + data["noise"])  # Justerat slutpris
         return data
 
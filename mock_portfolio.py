@@ -1,24 +1,56 @@
 import logging
+import numpy as np
+from risk_limits import next_risk_limit
+
+log = logging.getLogger(__name__)
 
 class MockPortfolio:
-    def __init__(self, initial_balance=10000, fee_rate=0.001):
+    def __init__(self, initial_balance=10000, fee_rate=0.001, assets=None):
         """
         Mock-version av Portfolio.
         :param initial_balance: Startsaldo för den mockade portföljen.
         :param fee_rate: Avgiftssats för transaktioner.
+        :param assets: Fast ordning av tillgångar som innehavsvektorn följer (samma som miljön).
         """
         self.initial_balance = initial_balance
         self.balance = initial_balance
         self.fee_rate = fee_rate
-        self.holdings = {}  # Dict som lagrar innehav per symbol
+        self.assets = list(assets) if assets is not None else []
+        self._asset_index = {asset: i for i, asset in enumerate(self.assets)}
+        self._holdings_vec = np.zeros(len(self.assets))  # Innehav i samma ordning som self.assets
+        # Senast kända priser; mockade priser tills miljön skickar in riktiga
+        self._last_prices = np.array([self.get_current_price(asset) for asset in self.assets], dtype=np.float64)
+        self.risk_limit = 0.05  # Standard riskgräns på 5%
+        self.growth_limit = 0.2  # Standard tillväxtgräns på 20%
         self.trading_active = True
 
     def reset(self):
         """Återställ portföljens tillstånd till det ursprungliga läget."""
         self.balance = self.initial_balance
-        self.holdings = {}  # Rensa alla innehav
+        self._holdings_vec[:] = 0.0  # Rensa alla innehav
         self.trading_active = True
-        logging.info("Portföljens tillstånd har återställts.")
+        if log.isEnabledFor(logging.INFO):
+            log.info("Portföljens tillstånd har återställts.")
+
+    @property
+    def holdings(self):
+        """Innehav per symbol som dict (byggs från innehavsvektorn, endast tillgångar med innehav)."""
+        return {asset: float(quantity) for asset, quantity in zip(self.assets, self._holdings_vec) if quantity != 0}
+
+    def adjust_risk_limit(self, performance, volatility=0.0):
+        """
+        Justera riskgränsen dynamiskt baserat på prestation och volatilitet (samma regler som EnhancedPortfolio).
+        :param performance: Agentens senaste avkastning (positiv eller negativ).
+        :param volatility: Marknadens volatilitet.
+        """
+        self.risk_limit = next_risk_limit(self.risk_limit, performance, volatility)
+
+    def adjust_growth_limit(self, trend_strength):
+        """
+        Justera tillväxtgränsen dynamiskt baserat på trendstyrka.
+        :param trend_strength: Ett värde mellan 0 och 1 som representerar hur stark trenden är.
+        """
+        self.growth_limit = min(0.8, 0.3 + 0.5 * trend_strength)
 
     def calculate_risk(self, price, quantity):
         """
@@ -30,19 +62,19 @@ class MockPortfolio:
         total_investment = price * quantity
         return total_investment / self.balance
 
-    def can_invest_more(self, symbol, price, quantity):
+    def can_invest_more(self, symbol, price, quantity, prices):
         """
         Kontrollera om investeringen överskrider en viss tillgångsandel.
         :param symbol: Symbol för tillgången.
         :param price: Pris för tillgången.
         :param quantity: Antal enheter att köpa.
+        :param prices: ndarray med aktuella priser i samma ordning som self.assets.
         :return: True om investeringen är inom tillväxtgränsen, annars False.
         """
-        current_value = self.holdings.get(symbol, 0) * price
+        idx = self._asset_index.get(symbol)
+        current_value = self._holdings_vec[idx] * price if idx is not None else 0.0
         new_value = current_value + price * quantity
-        total_portfolio_value = self.balance + sum(
-            qty * price for qty, price in self.holdings.items()
-        )
+        total_portfolio_value = self.balance + float(self._holdings_vec @ prices)
         return new_value / total_portfolio_value <= 0.2  # Exempelgräns på 20%
 
     def buy(self, symbol, price, quantity):
@@ -55,14 +87,19 @@ class MockPortfolio:
         if not self.trading_active:
             raise ValueError("Handel är avstängd.")
 
+        idx = self._asset_index.get(symbol)
+        if idx is None:
+            raise ValueError(f"Symbol {symbol} ingår inte i portföljen.")
+
         total_cost = price * quantity * (1 + self.fee_rate)
 
         if total_cost > self.balance:
             raise ValueError("Inte tillräckligt med saldo för att köpa.")
 
         self.balance -= total_cost
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        logging.info(f"Köpt {quantity} av {symbol} för {price}. Totalkostnad: {total_cost}.")
+        self._holdings_vec[idx] += quantity
+        if log.isEnabledFor(logging.INFO):
+            log.info("Köpt %s av %s för %s. Totalkostnad: %s.", quantity, symbol, price, total_cost)
 
     def sell(self, symbol, price, quantity):
         """
@@ -74,35 +111,66 @@ class MockPortfolio:
         if not self.trading_active:
             raise ValueError("Handel är avstängd.")
 
-        if symbol not in self.holdings or self.holdings[symbol] < quantity:
+        idx = self._asset_index.get(symbol)
+        if idx is None or self._holdings_vec[idx] <= 0 or self._holdings_vec[idx] < quantity:
             raise ValueError("Inte tillräckligt med tillgångar för att sälja.")
 
         total_value = price * quantity * (1 - self.fee_rate)
         self.balance += total_value
-        self.holdings[symbol] -= quantity
+        self._holdings_vec[idx] -= quantity
 
-        if self.holdings[symbol] == 0:
-            del self.holdings[symbol]  # Ta bort symbolen om inga innehav finns kvar
+        if log.isEnabledFor(logging.INFO):
+            log.info("Sålt %s av %s för %s. Totalvärde: %s.", quantity, symbol, price, total_value)
+
+    def apply_actions(self, action_vec, prices):
+        """
+        Genomför köp och sälj för alla tillgångar på en gång.
+        Köp (action > 0) använder andelen action av saldot vid stegets början. Om köpen inklusive avgift
+        kostar mer än saldot skalas alla köp ned proportionellt. Sälj (action < 0) avyttrar andelen -action
+        av nuvarande innehav. Actions klipps till [-1, 1].
+        :param action_vec: ndarray med en action per tillgång i samma ordning som self.assets.
+        :param prices: ndarray med aktuella priser i samma ordning som self.assets.
+        :return: ndarray med köpt (+) eller sålt (-) antal per tillgång.
+        """
+        if not self.trading_active:
+            raise ValueError("Handel är avstängd.")
+
+        # Andelar utanför [-1, 1] skulle sälja mer än innehavet (negativt innehav)
+        action_vec = np.clip(np.asarray(action_vec, dtype=np.float64), -1.0, 1.0)
+        self._last_prices[:] = prices
+        buy_qty = np.where(action_vec > 0, action_vec * self.balance / prices, 0.0)
+        sell_qty = np.where(action_vec < 0, -action_vec * self._holdings_vec, 0.0)
+
+        total_cost = float(buy_qty @ prices) * (1 + self.fee_rate)
+        if total_cost > self.balance:
+            buy_qty *= self.balance / total_cost
+            total_cost = self.balance
 
-        logging.info(f"Sålt {quantity} av {symbol} för {price}. Totalvärde: {total_value}.")
+        total_value = float(sell_qty @ prices) * (1 - self.fee_rate)
+        self.balance += total_value - total_cost
+        traded = buy_qty - sell_qty
+        self._holdings_vec += traded
+        return traded
 
     def log_summary(self):
         """
         Logga en sammanfattning av portföljens status.
         """
-        logging.info(f"Mocked Portfolio Balance: {self.balance}")
-        logging.info(f"Holdings: {self.holdings}")
+        log.info(f"Mocked Portfolio Balance: {self.balance}")
+        log.info(f"Holdings: {self.holdings}")
 
-    def get_total_value(self):
+    def get_total_value(self, current_prices=None):
         """
         Beräkna det totala värdet på portföljen.
+        :param current_prices: ndarray med priser i samma ordning som self.assets, eller dict med pris per symbol.
+                               Utan den används senast kända priser.
         :return: Totalt värde av portföljen, inklusive kontanter och tillgångar.
         """
-        total_value = self.balance
-        for symbol, quantity in self.holdings.items():
-            # För varje innehav, multiplicera med aktuellt pris
-            total_value += quantity * self.get_current_price(symbol)
-        return total_value
+        if current_prices is not None:
+            if isinstance(current_prices, dict):
+                current_prices = [current_prices.get(asset, 0) for asset in self.assets]
+            self._last_prices[:] = current_prices
+        return self.balance + float(self._holdings_vec @ self._last_prices)
 
     def get_current_price(self, symbol):
         """
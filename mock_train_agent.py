@@ -10,7 +10,7 @@ from stable_baselines3.common.vec_env import SubprocVecEnv
 from stable_baselines3.common.env_checker import check_env
 
 from config import Config
-from agent import MultiAssetTradingEnv
+from agent import MultiAssetTradingEnv, share_env_matrices
 from mock_market import MockMarket
 from mock_portfolio import MockPortfolio
 
@@ -24,15 +24,17 @@ if __name__ == "__main__":
     training_config = config.get("training")
     env_config = config.get("environment")
 
-    # Initiera mockad marknad och portfölj
+    # Initiera mockad marknad
     market = MockMarket()
-    portfolio = MockPortfolio(initial_balance=env_config.get("initial_balance", 10000))
 
     # Hämta mockad marknadsdata och historisk data
     market_data = market.fetch_market_data(min_volume=env_config["min_volume"])
     symbols = market_data["symbol"].tolist()
     logging.info(f"Mockade aktiva symboler: {symbols}")
 
+    # Initiera mockad portfölj med samma tillgångsordning som miljön
+    portfolio = MockPortfolio(initial_balance=env_config.get("initial_balance", 10000), assets=symbols)
+
     historical_data = {}
     for symbol in symbols:
         historical_data[symbol] = market.fetch_historical_data(
@@ -41,9 +43,12 @@ if __name__ == "__main__":
             limit=env_config["data_limit"]
         )
 
+    # Beräkna indikatorer och matriser en gång och dela dem med alla miljöer via delat minne
+    shared_meta = share_env_matrices(historical_data)
+
     # Skapa miljö
     def create_env():
-        return MultiAssetTradingEnv(market=market, portfolio=portfolio, historical_data=historical_data)
+        return MultiAssetTradingEnv(market=market, portfolio=portfolio, shared_meta=shared_meta)
 
     # Kontrollera miljöns kompatibilitet
     try:
@@ -55,7 +60,7 @@ if __name__ == "__main__":
 
     # Skapa en SubprocVecEnv för parallellisering
     def make_env():
-        return MultiAssetTradingEnv(market=market, portfolio=portfolio, historical_data=historical_data)
+        return MultiAssetTradingEnv(market=market, portfolio=portfolio, shared_meta=shared_meta)
 
     env = SubprocVecEnv([make_env for _ in range(training_config.get("num_envs", 4))])
 
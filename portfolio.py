@@ -1,43 +1,302 @@
-import os
-import json
 import logging
 import numpy as np
 import pandas as pd
-from typing import Dict
+from scipy.linalg import LinAlgError, cho_solve, get_lapack_funcs
+from typing import Dict, Optional
 from market import Market
-from config import Config
-import ta  # För tekniska indikatorer
+from risk_limits import clip_risk_limit, next_risk_limit, risk_factor
+
+try:
+    from numba import guvectorize, njit
+except ImportError:  # Numba är valfritt; utan det körs kärnorna som vanlig Python
+    guvectorize = None
+
+    def njit(*args, **kwargs):
+        """Ersättare för numba.njit som returnerar funktionen oförändrad."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+log = logging.getLogger(__name__)
+
+# Antal slippage-dragningar som genereras åt gången
+SLIPPAGE_BUFFER_SIZE = 4096
+
+
+# Antal inkrementella steg mellan fullständiga omfaktoriseringar i optimize_portfolio_incremental
+INCREMENTAL_REFACTOR_INTERVAL = 50
+
+# Felkoder från _execute_trade_nb
+TRADE_OK = 0
+TRADE_RISK_LIMIT = 1
+TRADE_GROWTH_LIMIT = 2
+TRADE_INSUFFICIENT_BALANCE = 3
+TRADE_INSUFFICIENT_HOLDINGS = 4
+
+
+@njit(cache=True)
+def _within_growth_limit_nb(held_value, trade_value, total_value, growth_limit):
+    """
+    Avgör om tillgångens andel efter köpet ryms inom tillväxtgränsen.
+    :param held_value: Värdet av befintligt innehav i tillgången (>= 0).
+    :param trade_value: Köpets värde.
+    :param total_value: Portföljens totala värde (saldo + innehav).
+    :return: True om (held_value + trade_value) / total_value <= growth_limit.
+    """
+    max_value = growth_limit * total_value
+    # Handeln ensam överskrider redan gränsen; befintligt innehav kan bara öka andelen
+    if trade_value > max_value:
+        return False
+    return held_value + trade_value <= max_value
+
+
+@njit(cache=True)
+def _execute_trade_nb(balance, holdings_value, qty, last_price, idx, price, quantity, fee_buy, fee_sell,
+                      risk_limit, growth_limit, slip):
+    """
+    Genomför ett köp (quantity > 0) eller sälj (quantity < 0) med enbart numeriska argument.
+    qty och last_price uppdateras på plats; saldo och innehavsvärde (qty @ last_price) returneras.
+    :param holdings_value: Innehavens värde före affären, uppdateras inkrementellt i O(1).
+    :param fee_buy: Kostnadsmultiplikator vid köp, 1 + avgiftssats.
+    :param fee_sell: Intäktsmultiplikator vid sälj, 1 - avgiftssats.
+    :param slip: Relativ slippage som redan dragits, handelspriset blir price * (1 + slip).
+    :return: (nytt saldo, nytt innehavsvärde, felkod) där TRADE_OK betyder att affären genomfördes.
+    """
+    if quantity < 0:  # Sälj
+        quantity = -quantity
+        if qty[idx] < quantity:
+            return balance, holdings_value, TRADE_INSUFFICIENT_HOLDINGS
+        price = price * (1.0 + slip)
+        holdings_value += qty[idx] * (price - last_price[idx]) - quantity * price
+        last_price[idx] = price
+        qty[idx] -= quantity
+        return balance + price * quantity * fee_sell, holdings_value, TRADE_OK
+
+    price = price * (1.0 + slip)
+    if price * quantity / balance > risk_limit:
+        return balance, holdings_value, TRADE_RISK_LIMIT
+
+    # Omvärdera tillgångens befintliga innehav till handelspriset
+    holdings_value += qty[idx] * (price - last_price[idx])
+    last_price[idx] = price
+    if not _within_growth_limit_nb(qty[idx] * price, quantity * price, balance + holdings_value, growth_limit):
+        return balance, holdings_value, TRADE_GROWTH_LIMIT
+
+    total_cost = price * quantity * fee_buy
+    if total_cost > balance:
+        return balance, holdings_value, TRADE_INSUFFICIENT_BALANCE
+
+    qty[idx] += quantity
+    return balance - total_cost, holdings_value + price * quantity, TRADE_OK
+
+
+@njit(cache=True)
+def _chol_update_nb(chol, vec, sign):
+    """
+    Rank-1-uppdatering (sign = 1.0) eller nedräkning (sign = -1.0) av en nedre Cholesky-faktor på plats,
+    så att chol * chol^T blir A + sign * vec * vec^T. Kostar O(n^2) mot O(n^3) för en ny faktorisering.
+    :return: False om nedräkningen skulle göra matrisen indefinit (chol är då ogiltig).
+    """
+    vec = vec.copy()
+    n = vec.shape[0]
+    for k in range(n):
+        diag = chol[k, k]
+        radicand = diag * diag + sign * vec[k] * vec[k]
+        if radicand <= 0.0:
+            return False
+        new_diag = np.sqrt(radicand)
+        cos = new_diag / diag
+        sin = vec[k] / diag
+        chol[k, k] = new_diag
+        for i in range(k + 1, n):
+            chol[i, k] = (chol[i, k] + sign * sin * vec[i]) / cos
+            vec[i] = cos * vec[i] - sin * chol[i, k]
+    return True
+
+
+def _warmup():
+    """Kompilera Numba-kärnorna vid import så att första anropet inte betalar JIT-kostnaden."""
+    _execute_trade_nb(1.0, 0.0, np.zeros(1), np.ones(1), 0, 1.0, 0.0, 1.0, 1.0, 1.0, 1.0, 0.0)
+    _chol_update_nb(np.ones((1, 1)), np.zeros(1), 1.0)
+
+
+_warmup()
+
+
+def _mvo_weights_kernel(cov, mu, out):
+    """
+    Normaliserade MVO-vikter för ett fönster: Cholesky av cov, framåt- och bakåtsubstitution för
+    cov * w = mu och normalisering så att vikterna summerar till 1. Icke positivt definit cov ger NaN.
+    """
+    n = mu.shape[0]
+    chol = np.zeros((n, n))
+    for j in range(n):
+        diag = cov[j, j]
+        for k in range(j):
+            diag -= chol[j, k] * chol[j, k]
+        diag = np.sqrt(diag)
+        chol[j, j] = diag
+        for i in range(j + 1, n):
+            acc = cov[i, j]
+            for k in range(j):
+                acc -= chol[i, k] * chol[j, k]
+            chol[i, j] = acc / diag
+
+    for i in range(n):  # L * y = mu
+        acc = mu[i]
+        for k in range(i):
+            acc -= chol[i, k] * out[k]
+        out[i] = acc / chol[i, i]
+    for i in range(n - 1, -1, -1):  # L^T * w = y
+        acc = out[i]
+        for k in range(i + 1, n):
+            acc -= chol[k, i] * out[k]
+        out[i] = acc / chol[i, i]
+
+    total = 0.0
+    for i in range(n):
+        total += out[i]
+    for i in range(n):
+        out[i] /= total
+
+
+if guvectorize is not None:
+    # Kompileras per form och broadcastar över ledande axlar: (..., n, n), (..., n) -> (..., n)
+    _mvo_weights = guvectorize(["void(f8[:,:], f8[:], f8[:])"], "(n,n),(n)->(n)", cache=True)(_mvo_weights_kernel)
+else:
+    def _mvo_weights(cov, mu, out=None):
+        """Numpy-version av _mvo_weights med samma broadcasting, används utan Numba."""
+        weights = np.linalg.solve(cov, mu[..., None])[..., 0]
+        weights /= weights.sum(axis=-1, keepdims=True)
+        if out is None:
+            return weights
+        out[...] = weights
+        return out
+
+
+def _ledoit_wolf_covariance(returns: np.ndarray) -> np.ndarray:
+    """
+    Ledoit–Wolf-krympt kovariansmatris mot målet mu * I (mu = genomsnittlig varians).
+    Samma skattning som sklearn.covariance.LedoitWolf, utan att kräva sklearn.
+    :param returns: ndarray (T, n) med historiska avkastningar.
+    :return: Krympt kovariansmatris (n, n).
+    """
+    num_obs, num_assets = returns.shape
+    centered = returns - returns.mean(axis=0)
+    sample_cov = centered.T @ centered / num_obs
+    mu = np.trace(sample_cov) / num_assets
+
+    # delta: avstånd från sample_cov till målet, beta: skattningsbruset i sample_cov
+    cov_sq_sum = np.einsum('ij,ij->', sample_cov, sample_cov)
+    delta = (cov_sq_sum - 2 * mu * np.trace(sample_cov) + num_assets * mu ** 2) / num_assets
+    row_norms = np.einsum('ti,ti->t', centered, centered)
+    beta = (np.einsum('t,t->', row_norms, row_norms) / num_obs - cov_sq_sum) / (num_assets * num_obs)
+    shrinkage = 0.0 if delta == 0 else min(beta, delta) / delta
+
+    shrunk = (1 - shrinkage) * sample_cov
+    shrunk.flat[::num_assets + 1] += shrinkage * mu
+    return shrunk
+
 
 # Förbättrade funktioner för riskhantering, slippage och dynamisk portföljhantering
 class EnhancedPortfolio:
-    def __init__(self, market: Market, historical_data: Dict[str, pd.DataFrame]):
+    def __init__(self, market: Market, historical_data: Dict[str, pd.DataFrame], seed: Optional[int] = None):
         self.market = market
         self.historical_data = historical_data
         self.balance = 10000  # Startsaldo
-        self.fee_rate = 0.001  # Transaktionsavgift
-        self.holdings = {}
+        self.fee_rate = 0.001  # Transaktionsavgift (sätter även _fee_buy/_fee_sell)
+
+        # Innehav och senast kända priser som vektorer i historical_data-ordning (symbol -> index)
+        self._symbols = list(historical_data.keys())
+        self._sym2idx = {symbol: i for i, symbol in enumerate(self._symbols)}
+        self._qty = np.zeros(len(self._symbols))
+        self._last_price = np.array([
+            data["close"].iat[-1] if "close" in data and len(data) else 0.0
+            for data in historical_data.values()
+        ], dtype=np.float64)
+        self._holdings_value = 0.0  # Cache av self._qty @ self._last_price, uppdateras per affär
+
+        # Historiken som en sammanhängande float32-array (tillgång, tid, fält); historical_data behålls för externa anrop
+        self._hist, self._fields = self._stack_history(historical_data)
+        self._field_idx = {field: i for i, field in enumerate(self._fields)}
+
+        # Tillstånd för optimize_portfolio_incremental (sätts av reset_incremental)
+        self._inc_columns = None
+        self._inc_count = 0
+        self._inc_mean = None
+        self._inc_scatter = None  # Summan av (x - medel)(x - medel)^T över fönstret
+        self._inc_chol = None
+        self._inc_steps = 0
+
         self.risk_limit = 0.05  # Standard riskgräns på 5%
         self.growth_limit = 0.2  # Standard tillväxtgräns på 20%
         self.max_balance = self.balance  # För spårning av toppvärde
         self.performance = 0  # För att spåra prestation
         self.trading_active = True
 
+        # Slippage dras i block från en egen generator (enhetsintervall [-1, 1), skalas per anrop)
+        self._rng = np.random.default_rng(seed)
+        self._slip_buf = self._rng.uniform(-1.0, 1.0, SLIPPAGE_BUFFER_SIZE)
+        self._slip_idx = 0
+
+    @property
+    def fee_rate(self) -> float:
+        """Transaktionsavgift som andel av handelsvärdet."""
+        return self._fee_rate
+
+    @fee_rate.setter
+    def fee_rate(self, fee_rate: float) -> None:
+        """Sätt avgiftssatsen och räkna om multiplikatorerna som handelskärnan använder."""
+        self._fee_rate = float(fee_rate)
+        self._fee_buy = 1.0 + self._fee_rate
+        self._fee_sell = 1.0 - self._fee_rate
+
+    @property
+    def holdings(self) -> Dict[str, float]:
+        """Innehav per symbol som dict (byggs från self._qty, endast tillgångar med innehav)."""
+        return {symbol: float(quantity) for symbol, quantity in zip(self._symbols, self._qty) if quantity != 0}
+
+    @staticmethod
+    def _stack_history(historical_data: Dict[str, pd.DataFrame]):
+        """
+        Stapla historiken för alla tillgångar till en array med formen (n_assets, n_time, n_fields).
+        Endast numeriska kolumner som finns för alla tillgångar tas med, i den första tabellens ordning.
+        Tabeller av olika längd justeras mot sina senaste rader (kortaste längden).
+        :return: (array, lista med fältnamn)
+        """
+        frames = list(historical_data.values())
+        if not frames:
+            return np.empty((0, 0, 0), dtype=np.float32), []
+
+        fields = [
+            column for column in frames[0].columns
+            if all(column in df and pd.api.types.is_numeric_dtype(df[column]) for df in frames)
+        ]
+        n_time = min(len(df) for df in frames)
+        hist = np.stack([df[fields].to_numpy(dtype=np.float32)[len(df) - n_time:] for df in frames])
+        return np.ascontiguousarray(hist), fields
+
     def adjust_risk_limit(self, performance: float, volatility: float) -> None:
         """
         Justera riskgränsen dynamiskt baserat på prestation och volatilitet.
         :param performance: Agentens historiska prestation (positiv eller negativ avkastning).
         :param volatility: Marknadens volatilitet.
         """
-        if performance > 0:
-            self.risk_limit = min(0.1, self.risk_limit * 1.1)  # Öka riskgränsen till max 10%
-        else:
-            self.risk_limit = max(0.01, self.risk_limit * 0.9)  # Minska riskgränsen till minst 1%
+        self.risk_limit = next_risk_limit(self.risk_limit, performance, volatility)
 
-        # Justera riskgränsen baserat på volatilitet
-        if volatility > 0.02:
-            self.risk_limit = max(0.05, self.risk_limit * 0.9)  # Öka riskhantering vid hög volatilitet
-        else:
-            self.risk_limit = min(0.1, self.risk_limit * 1.05)  # Minska riskhantering vid låg volatilitet
+    def _adjust_risk_limits_vec(self, performance: float, volatility: np.ndarray) -> float:
+        """
+        Applicera riskregeln för en volatilitet per tillgång i tur och ordning.
+        :param performance: Agentens historiska prestation.
+        :param volatility: ndarray med senaste volatilitet per tillgång.
+        :return: Riskgränsen efter sista tillgången.
+        """
+        risk_limit = self.risk_limit
+        # Faktorerna beräknas på en gång; klippningen efter varje steg gör att själva
+        # ackumuleringen fortfarande måste ske i ordning.
+        for factor in risk_factor(performance, volatility).tolist():
+            risk_limit = clip_risk_limit(risk_limit * factor)
+        return risk_limit
 
     def adjust_growth_limit(self, trend_strength: float) -> None:
         """
@@ -53,7 +312,20 @@ class EnhancedPortfolio:
         :param slippage_factor: Justering för slippage (default 1%).
         :return: Det justerade priset.
         """
-        return price * (1 + np.random.uniform(-slippage_factor, slippage_factor))
+        return price * (1 + self._draw_slippage(slippage_factor))
+
+    def _draw_slippage(self, slippage_factor: float = 0.01) -> float:
+        """
+        Hämta nästa relativa slippage ur förgenererade dragningar.
+        :param slippage_factor: Maximal slippage åt vardera hållet.
+        :return: Slumpad slippage i [-slippage_factor, slippage_factor).
+        """
+        if self._slip_idx >= SLIPPAGE_BUFFER_SIZE:
+            self._slip_buf = self._rng.uniform(-1.0, 1.0, SLIPPAGE_BUFFER_SIZE)
+            self._slip_idx = 0
+        slip = self._slip_buf[self._slip_idx]
+        self._slip_idx += 1
+        return slippage_factor * slip
 
     def calculate_risk(self, price, quantity):
         """
@@ -68,82 +340,225 @@ class EnhancedPortfolio:
     def can_invest_more(self, symbol, price, quantity):
         """
         Kontrollera om investeringen överskrider en viss tillgångsandel.
+        buy() gör samma kontroll i handelskärnan; den här metoden är en fristående fråga för anropare.
         :param symbol: Symbol för tillgången.
         :param price: Pris för tillgången.
         :param quantity: Antal enheter att köpa.
         :return: True om investeringen är inom tillväxtgränsen, annars False.
         """
-        current_value = self.holdings.get(symbol, 0) * price
-        new_value = current_value + price * quantity
-        total_portfolio_value = self.balance + sum(
-            qty * price for qty, price in self.holdings.items()
-        )
-        return new_value / total_portfolio_value <= self.growth_limit
+        idx = self._symbol_index(symbol)
+        # Omvärdera tillgången till price enbart lokalt; en fråga ska inte ändra portföljens tillstånd
+        holdings_value = self._holdings_value + self._qty[idx] * (price - self._last_price[idx])
+        total_portfolio_value = self.balance + holdings_value
+        return bool(_within_growth_limit_nb(
+            float(self._qty[idx] * price), float(price * quantity), float(total_portfolio_value), float(self.growth_limit)
+        ))
+
+    def _symbol_index(self, symbol: str) -> int:
+        """
+        Slå upp symbolens position i innehavsvektorn.
+        :raises ValueError: Om symbolen inte ingår i portföljens universum.
+        """
+        idx = self._sym2idx.get(symbol)
+        if idx is None:
+            raise ValueError(f"Symbol {symbol} ingår inte i portföljen.")
+        return idx
 
     def buy(self, symbol: str, price: float, quantity: float) -> None:
         """Köp en tillgång med dynamisk slippage och riskkontroll."""
-        price = self.apply_slippage(price)  # Tillämpa slippage
-        total_cost = price * quantity * (1 + self.fee_rate)  # Inkludera avgift
-        risk = self.calculate_risk(price, quantity)
-
-        # Kontrollera om risk överskrider gränsen
-        if risk > self.risk_limit:
-            raise ValueError(f"Risk för handeln ({risk:.2%}) överskrider tillåten riskgräns ({self.risk_limit:.2%}).")
-
-        # Kontrollera om investeringen överskrider tillväxtgränsen
-        if not self.can_invest_more(symbol, price, quantity):
-            raise ValueError(f"Investeringen överskrider tillåten tillgångsandel ({self.growth_limit:.2%}).")
-
-        # Kontrollera om det finns tillräckligt med saldo
-        if total_cost > self.balance:
-            raise ValueError("Inte tillräckligt med saldo för att köpa.")
+        idx = self._symbol_index(symbol)
+        if quantity < 0:
+            raise ValueError("Antalet att köpa får inte vara negativt.")
 
-        self.balance -= total_cost
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
+        slip = self._draw_slippage()  # Tillämpa slippage
+        balance, self._holdings_value, error = _execute_trade_nb(
+            float(self.balance), self._holdings_value, self._qty, self._last_price, idx, float(price),
+            float(quantity), self._fee_buy, self._fee_sell, self.risk_limit, self.growth_limit, slip
+        )
+        self._raise_trade_error(error, price * (1 + slip), quantity)
+        self.balance = balance
 
     def sell(self, symbol: str, price: float, quantity: float) -> None:
         """Sälj en tillgång med dynamisk slippage och riskkontroll."""
-        if symbol not in self.holdings or self.holdings[symbol] < quantity:
+        idx = self._sym2idx.get(symbol)
+        if idx is None:
             raise ValueError("Inte tillräckligt med tillgångar för att sälja.")
+        if quantity < 0:
+            raise ValueError("Antalet att sälja får inte vara negativt.")
 
-        price = self.apply_slippage(price)  # Tillämpa slippage
-        total_value = price * quantity
-        self.balance += total_value * (1 - self.fee_rate)
-        self.holdings[symbol] -= quantity
+        slip = self._draw_slippage()  # Tillämpa slippage
+        balance, self._holdings_value, error = _execute_trade_nb(
+            float(self.balance), self._holdings_value, self._qty, self._last_price, idx, float(price),
+            -float(quantity), self._fee_buy, self._fee_sell, self.risk_limit, self.growth_limit, slip
+        )
+        self._raise_trade_error(error, price * (1 + slip), quantity)
+        self.balance = balance
 
-    def rebalance_portfolio(self, market_data: Dict[str, pd.DataFrame]) -> None:
-        """Omallokera portföljen baserat på marknadsdata och riskhantering."""
-        for asset, data in market_data.items():
-            volatility = data["volatility"].iloc[-1]  # Senaste volatiliteten
-            trend_strength = data["trend_strength"].iloc[-1]  # Senaste trendstyrkan
-            self.adjust_risk_limit(self.performance, volatility)
-            self.adjust_growth_limit(trend_strength)
-            self.balance *= (1 - self.growth_limit)
+    def _raise_trade_error(self, error: int, price: float, quantity: float) -> None:
+        """
+        Översätt en felkod från _execute_trade_nb till ValueError.
+        :param price: Handelspriset inklusive slippage.
+        :param quantity: Antal enheter i affären.
+        """
+        if error == TRADE_OK:
+            return
+        if error == TRADE_RISK_LIMIT:
+            risk = self.calculate_risk(price, quantity)
+            raise ValueError(f"Risk för handeln ({risk:.2%}) överskrider tillåten riskgräns ({self.risk_limit:.2%}).")
+        if error == TRADE_GROWTH_LIMIT:
+            raise ValueError(f"Investeringen överskrider tillåten tillgångsandel ({self.growth_limit:.2%}).")
+        if error == TRADE_INSUFFICIENT_BALANCE:
+            raise ValueError("Inte tillräckligt med saldo för att köpa.")
+        if error == TRADE_INSUFFICIENT_HOLDINGS:
+            raise ValueError("Inte tillräckligt med tillgångar för att sälja.")
+        raise ValueError(f"Okänd felkod från handelskärnan: {error}.")
 
-    def optimize_portfolio(self, returns: pd.DataFrame, cov_matrix: pd.DataFrame) -> pd.Series:
+    def rebalance_portfolio(self, market_data: Optional[Dict[str, pd.DataFrame]] = None) -> None:
+        """
+        Omallokera portföljen baserat på marknadsdata och riskhantering.
+        Saldot skalas en gång med (1 - medelvärdet av tillgångarnas tillväxtgränser).
+        :param market_data: Marknadsdata per tillgång. Utan den används den inlästa historiken (self._hist).
+        """
+        # Stäm av det inkrementella innehavsvärdet mot en full omräkning
+        self._holdings_value = float(self._qty @ self._last_price)
+
+        if market_data is None:
+            if not self._hist.size:
+                return
+            last_row = self._hist[:, -1, :]  # Senaste tidpunkten för alla tillgångar
+            volatility = last_row[:, self._field_idx["volatility"]].astype(np.float64)
+            trend_strength = last_row[:, self._field_idx["trend_strength"]].astype(np.float64)
+        else:
+            if not market_data:
+                return
+            # Senaste volatilitet och trendstyrka per tillgång direkt som skalärer, utan mellanliggande Series
+            frames, count = market_data.values(), len(market_data)
+            volatility = np.fromiter((data["volatility"].iat[-1] for data in frames), np.float64, count)
+            trend_strength = np.fromiter((data["trend_strength"].iat[-1] for data in frames), np.float64, count)
+
+        self.risk_limit = self._adjust_risk_limits_vec(self.performance, volatility)
+        growth_limits = np.minimum(0.8, 0.3 + 0.5 * trend_strength)  # Samma regel som adjust_growth_limit
+        self.growth_limit = float(growth_limits[-1])
+        # Kontantuttaget görs en gång per ombalansering, oberoende av antalet tillgångar
+        self.balance *= 1.0 - float(growth_limits.mean())
+
+    def optimize_portfolio(self, returns: pd.DataFrame, cov_matrix: pd.DataFrame, shrink: bool = False,
+                           dtype=np.float32) -> pd.Series:
         """
         Optimera portföljens tillgångar baserat på moderna portföljteorier.
         :param returns: DataFrame med historiska avkastningar för varje tillgång.
         :param cov_matrix: Kovariansmatris för tillgångarna.
+        :param shrink: Ersätt cov_matrix med en Ledoit–Wolf-krympt skattning från returns (bättre konditionerad).
+        :param dtype: Precision för kovarians och lösning. float32 räcker eftersom skattningsfelet i
+                      kovariansen är mycket större än avrundningsfelet; använd np.float64 vid behov.
         :return: En serie som representerar optimal allokering.
         """
-        inverse_cov = np.linalg.inv(cov_matrix)
-        weights = np.dot(inverse_cov, returns.mean())
-        weights /= np.sum(weights)  # Normalisera vikterna så att de summerar till 1
+        # Lös cov * w = mu via Cholesky (kovariansmatrisen är symmetrisk positivt definit) i stället för att invertera.
+        # Matrisen hålls Fortran-ordnad så att LAPACK faktoriserar den på plats utan intern kopia.
+        if shrink:
+            cov = _ledoit_wolf_covariance(returns.to_numpy(dtype=dtype)).T  # Symmetrisk, .T ger en F-ordnad vy
+        else:
+            cov = np.array(cov_matrix, dtype=dtype, order="F")  # Egen kopia, får skrivas över av faktoriseringen
+        mu = returns.mean().to_numpy(dtype=dtype)
+
+        potrf, potrs = get_lapack_funcs(("potrf", "potrs"), (cov,))  # spotrf/dpotrf efter dtype
+        chol, info = potrf(cov, lower=1, clean=0, overwrite_a=1)
+        if info != 0:
+            raise LinAlgError(f"Kovariansmatrisen är inte positivt definit (info={info}).")
+        weights, info = potrs(chol, mu, lower=1)
+        if info != 0:
+            raise LinAlgError(f"Lösningen av cov * w = mu misslyckades (info={info}).")
+        weights = weights.astype(np.float64)
+        weights /= weights.sum()  # Normalisera vikterna så att de summerar till 1
         return pd.Series(weights, index=returns.columns)
 
+    def optimize_portfolio_rolling(self, returns: pd.DataFrame, window: int) -> pd.DataFrame:
+        """
+        Optimera portföljen för varje rullande fönster av returns i ett enda anrop.
+        :param returns: DataFrame med historiska avkastningar för varje tillgång.
+        :param window: Antal observationer per fönster.
+        :return: DataFrame med en rad vikter per fönster, indexerad på fönstrets sista tidpunkt.
+        """
+        values = returns.to_numpy(dtype=np.float64)
+        windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)  # (k, n, window)
+        mu = windows.mean(axis=-1)
+        centered = windows - mu[..., None]
+        cov = np.einsum('kiw,kjw->kij', centered, centered) / (window - 1)  # Samma ddof som DataFrame.cov
+        weights = _mvo_weights(cov, mu)
+        return pd.DataFrame(weights, index=returns.index[window - 1:], columns=returns.columns)
+
+    def reset_incremental(self, returns: pd.DataFrame) -> pd.Series:
+        """
+        Initiera rullande optimering från ett fullt fönster och returnera dess vikter.
+        :param returns: DataFrame med fönstrets historiska avkastningar för varje tillgång.
+        :return: En serie som representerar optimal allokering för fönstret.
+        """
+        values = returns.to_numpy(dtype=np.float64)
+        self._inc_columns = returns.columns
+        self._inc_count = values.shape[0]
+        self._inc_mean = values.mean(axis=0)
+        centered = values - self._inc_mean
+        self._inc_scatter = centered.T @ centered
+        self._refactor_incremental()
+        return self._incremental_weights()
+
+    def optimize_portfolio_incremental(self, new_return_row, old_return_row) -> pd.Series:
+        """
+        Flytta det rullande fönstret ett steg och optimera om med rank-1-uppdateringar av Cholesky-faktorn.
+        Lägger till new_return_row och tar bort old_return_row; fönstrets längd är oförändrad.
+        Faktorn räknas om från grunden var INCREMENTAL_REFACTOR_INTERVAL:e steg eller om en nedräkning misslyckas.
+        :param new_return_row: Avkastningar för den nya observationen, en per tillgång.
+        :param old_return_row: Avkastningar för observationen som lämnar fönstret.
+        :return: En serie som representerar optimal allokering.
+        """
+        if self._inc_chol is None:
+            raise ValueError("Inkrementell optimering är inte initierad; anropa reset_incremental först.")
+
+        new_row = np.asarray(new_return_row, dtype=np.float64)
+        old_row = np.asarray(old_return_row, dtype=np.float64)
+        count = self._inc_count
+
+        # Lägg till new_row (fönstret växer till count + 1)
+        add_vec = (new_row - self._inc_mean) * np.sqrt(count / (count + 1))
+        self._inc_mean = self._inc_mean + (new_row - self._inc_mean) / (count + 1)
+        self._inc_scatter += np.outer(add_vec, add_vec)
+
+        # Ta bort old_row (tillbaka till count)
+        remove_vec = (old_row - self._inc_mean) * np.sqrt((count + 1) / count)
+        self._inc_mean = self._inc_mean - (old_row - self._inc_mean) / count
+        self._inc_scatter -= np.outer(remove_vec, remove_vec)
+
+        self._inc_steps += 1
+        if self._inc_steps >= INCREMENTAL_REFACTOR_INTERVAL:
+            self._refactor_incremental()
+        else:
+            _chol_update_nb(self._inc_chol, add_vec, 1.0)
+            if not _chol_update_nb(self._inc_chol, remove_vec, -1.0):
+                self._refactor_incremental()
+        return self._incremental_weights()
+
+    def _refactor_incremental(self) -> None:
+        """Faktorisera spridningsmatrisen från grunden för att nollställa ackumulerat avrundningsfel."""
+        self._inc_chol = np.linalg.cholesky(self._inc_scatter)
+        self._inc_steps = 0
+
+    def _incremental_weights(self) -> pd.Series:
+        """Lös scatter * w = medel med den aktuella faktorn (skalan spelar ingen roll efter normalisering)."""
+        weights = cho_solve((self._inc_chol, True), self._inc_mean, check_finite=False)
+        weights /= weights.sum()
+        return pd.Series(weights, index=self._inc_columns)
+
     def log_summary(self) -> None:
         """
         Logga en sammanfattning av portföljens status.
         """
-        logging.info(f"Portfolio balance: {self.balance}")
-        logging.info(f"Risk limit: {self.risk_limit}")
-        logging.info(f"Growth limit: {self.growth_limit}")
-        logging.info(f"Holdings: {json.dumps(self.holdings)}")
+        if log.isEnabledFor(logging.INFO):
+            log.info("Portfolio balance: %s | risk: %s | growth: %s | holdings: %s",
+                     self.balance, self.risk_limit, self.growth_limit, self.holdings)
 
     def stop_trading(self) -> None:
         """
         Stopp handel om drawdown överskrider tröskeln eller om andra riskfaktorer uppstår.
         """
-        logging.warning("Trading has been stopped due to excessive drawdown or risk factors.")
+        log.warning("Trading has been stopped due to excessive drawdown or risk factors.")
         self.trading_active = False
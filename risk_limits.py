@@ -0,0 +1,33 @@
+import numpy as np
+
+# Gränser för den dynamiska riskgränsen (andel av saldot per affär)
+RISK_LIMIT_MIN = 0.01
+RISK_LIMIT_MAX = 0.1
+
+
+def risk_factor(performance, volatility):
+    """
+    Multiplikativ faktor för riskgränsen: +10%/-10% efter prestation, -10%/+5% efter volatilitet.
+    Fungerar både för skalärer och ndarrays av volatilitet.
+    :param performance: Agentens prestation (positiv eller negativ avkastning).
+    :param volatility: Marknadens volatilitet, skalär eller ndarray.
+    :return: Faktor med samma form som volatility.
+    """
+    return np.where(performance > 0, 1.1, 0.9) * np.where(volatility > 0.02, 0.9, 1.05)
+
+
+def clip_risk_limit(risk_limit: float) -> float:
+    """Begränsa riskgränsen till [RISK_LIMIT_MIN, RISK_LIMIT_MAX]."""
+    return min(RISK_LIMIT_MAX, max(RISK_LIMIT_MIN, float(risk_limit)))
+
+
+def next_risk_limit(risk_limit: float, performance: float, volatility: float) -> float:
+    """
+    Beräkna nästa riskgräns utifrån prestation och volatilitet.
+    Gemensam regel för EnhancedPortfolio och MockPortfolio.
+    :param risk_limit: Nuvarande riskgräns.
+    :param performance: Agentens prestation (positiv eller negativ avkastning).
+    :param volatility: Marknadens volatilitet.
+    :return: Ny riskgräns.
+    """
+    return clip_risk_limit(risk_limit * float(risk_factor(performance, volatility)))